@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Scaled-down benchmarks of the Sunda margin model
+# Runs the model with configs/benchmark.toml (synthetic slab, no /scratch data) with
+# mpirun -np 1..N and summarises strong/weak scaling from the json results, one row
+# per solver and process count.
+#
+# strong scaling: same resolution on every process count
+#     python run_benchmarks.py --nprocs 1 2 4 8 --res 16,56,76
+# weak scaling: resX grows with the process count (elements per rank kept fixed)
+#     python run_benchmarks.py --nprocs 1 2 4 8 --res 16,56,76 --weak
+# solver comparison: time and peak memory of each solve side by side
+#     python run_benchmarks.py --nprocs 1 2 4 --solver fgmres loose_inner
+
+import argparse
+import json
+import os
+import subprocess
+
+repo_dir     = os.path.dirname(os.path.abspath(__file__))
+bench_config = os.path.join(repo_dir, 'configs', 'benchmark.toml')
+phases       = ('setup', 'solve', 'checkpoint', 'update')
+
+
+def run_res(res, nprocs, nprocs_min, weak):
+    """
+    Resolution (resZ, resX, resY) of the run on nprocs processes, resX grows
+    with nprocs/nprocs_min for weak scaling (nprocs a multiple of nprocs_min).
+    """
+    resZ, resX, resY = res
+    scale = nprocs//nprocs_min if weak else 1
+    return [resZ, resX*scale, resY]
+
+
+def run(nprocs, res, steps, results, output, scaling, solver):
+    """
+    Runs one benchmark of the model script on nprocs processes.
+    """
+    overrides = {'ncpus': nprocs, 'resZ': res[0], 'resX': res[1], 'resY': res[2], 'maxSteps': steps,
+                 'benchmark_results': repr(os.path.abspath(results)), 'output_root': repr(os.path.abspath(output)),
+                 'benchmark_scaling': repr(scaling), 'solver': repr(solver)}
+    command   = ['mpirun', '-np', str(nprocs), 'python', '-m', 'sum_sph', bench_config]
+    for key, value in overrides.items():
+        command += ['--set', '{}={}'.format(key, value)]
+    subprocess.check_call(command, cwd=repo_dir)
+
+
+def summarise(records, weak):
+    """
+    Prints mean phase times, the largest solve peak memory and increase over the
+    pre-solve memory (MB per rank) of each run, solvers side by side per process
+    count, and the parallel efficiency of solve + update relative to the smallest
+    process count n1 of the same solver (t1/tN for weak scaling, t1*n1/(tN*N) for
+    strong scaling).
+    """
+    records    = sorted(records, key=lambda r: (r['nprocs'], r['solver']))
+    base       = {}
+    for r in records:
+        base.setdefault(r['solver'], r)
+    print ('{0:>10s} {1:>12s} {2:>10s} {3:>10s} '.format('commit', 'solver', 'nprocs', 'elements')
+           + ' '.join('{0:>11s}'.format(p) for p in phases)
+           + ' {0:>11s} {1:>11s} {2:>11s}'.format('peak_MB', 'incr_MB', 'efficiency'))
+    for r in records:
+        mean       = {p: sum(r[p])/len(r[p]) if r[p] else float('nan') for p in phases}
+        total      = sum(r['solve']) + sum(r['update'])
+        b          = base[r['solver']]
+        b_total    = sum(b['solve']) + sum(b['update'])
+        if weak:
+            efficiency = b_total/total
+        else:
+            efficiency = b_total*b['nprocs']/(total*r['nprocs'])
+        peak       = max(r.get('solve_peak_MB') or [float('nan')])
+        increase   = max(r.get('solve_increase_MB') or [float('nan')])
+        commit     = str(r['commit']) + ('+dirty' if r.get('dirty') else '')
+        print ('{0:>10s} {1:>12s} {2:10d} {3:10d} '.format(commit, r['solver'], r['nprocs'], r['elements'])
+               + ' '.join('{0:11.3e}'.format(mean[p]) for p in phases)
+               + ' {0:11.1f} {1:11.1f} {2:11.2f}'.format(peak, increase, efficiency))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaled-down benchmarks of the Sunda margin model')
+    parser.add_argument('--nprocs', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--res', default='16,56,76', help='resZ,resX,resY on the smallest process count')
+    parser.add_argument('--weak', action='store_true', help='scale resX with the process count')
+    parser.add_argument('--solver', nargs='+', default=['fgmres'], help='solver options to compare')
+    parser.add_argument('--steps', type=int, default=2)
+    parser.add_argument('--results', default='benchmark.jsonl', help='json lines file the runs are appended to')
+    parser.add_argument('--output', default='./bench_output/')
+    parser.add_argument('--summary-only', action='store_true', help='only summarise an existing results file')
+    args = parser.parse_args()
+
+    res     = [int(r) for r in args.res.split(',')]
+    if args.weak and any(n % min(args.nprocs) for n in args.nprocs):
+        parser.error('--weak needs process counts that are multiples of the smallest ({}), got {}'.format(min(args.nprocs), args.nprocs))
+    scaling = 'weak' if args.weak else 'strong'
+    if not args.summary_only:
+        for nprocs in args.nprocs:
+            for solver in args.solver:
+                run(nprocs, run_res(res, nprocs, min(args.nprocs), args.weak), args.steps, args.results, args.output, scaling, solver)
+
+    with open(args.results) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    # runs of this scaling mode, solvers, resolution and step count
+    records = [r for r in records if r.get('scaling') == scaling and r['steps'] == args.steps and r['nprocs'] in args.nprocs
+               and r['solver'] in args.solver and r['res'] == run_res(res, r['nprocs'], min(args.nprocs), args.weak)]
+    if not records:
+        raise SystemExit("No {} scaling runs with res {} and {} steps in {}".format(scaling, args.res, args.steps, args.results))
+    # latest run of the most recent tree (commit and dirty flag) for every solver and process count
+    tree    = (records[-1]['commit'], records[-1]['dirty'])
+    latest  = {(r['solver'], r['nprocs']): r for r in records if (r['commit'], r['dirty']) == tree}
+    summarise(list(latest.values()), args.weak)
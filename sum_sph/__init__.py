@@ -0,0 +1,8 @@
+# coding: utf-8
+
+# # 3D Subduction Model of Sunda Margin
+# config and geometry helpers import without underworld, the model phases
+# (setup, solve, checkpoint, advect, run) live in sum_sph.model
+
+from .config import DEFAULTS, load_config, validate_config, derive_paths
+from .geometry import sphxyz2sphlonlatr, sphlonlatr2sphxyz
@@ -0,0 +1,31 @@
+# coding: utf-8
+
+# # Command line entry point
+#     mpirun -np 1104 python -m sum_sph configs/128448608_1104_sum_sph_coh_25_DMesh.toml
+#     mpirun -np 4 python -m sum_sph configs/benchmark.toml --set resX=112 --set ncpus=4
+
+import argparse
+
+from .config import load_config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m sum_sph', description='3D subduction model of the Sunda margin')
+    parser.add_argument('config', nargs='?', help='.toml/.yaml config file, defaults are used for missing keys')
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='KEY=VALUE',
+                        help='override a config value (TOML syntax), may be repeated')
+    parser.add_argument('--check', action='store_true', help='validate the config, print derived paths and exit')
+    args = parser.parse_args(argv)
+
+    cfg = load_config(args.config, args.overrides)
+    if args.check:
+        for key in ('res', 'file_str', 'outputPath', 'inputPath'):
+            print ('{0:12s} {1}'.format(key, cfg[key]))
+        return
+
+    from .model import run
+    run(cfg)
+
+
+if __name__ == '__main__':
+    main()
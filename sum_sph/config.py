@@ -0,0 +1,211 @@
+# coding: utf-8
+
+# # Run configuration of the Sunda margin model
+# Settings are read from a TOML or YAML file, checked against DEFAULTS and
+# completed with the derived resolution string, file string and paths.
+
+import math
+import os
+
+# every accepted setting with its default (production run) value
+DEFAULTS = {
+    # max, min values of lon & lat in the region
+    'lon_min'               : 61.0,
+    'lon_max'               : 120.0,
+    'lat_min'               : -45.0,
+    'lat_max'               : 35.0,
+
+    # model resolution
+    'deform_mesh'           : True,     # deforms the mesh
+    'ncpus'                 : 1104,
+    'resX'                  : 448,
+    'resY'                  : 608,
+    'resZ'                  : 128,
+    'Mdepth'                : 2891.,
+
+    # subducting plate crustal layer thickness in the model
+    'crust_depth'           : 30,
+
+    # cohesion value (MPa) and yield stress form
+    'sum_coh_dim'           : 25,
+    'him_coh_dim'           : 10,
+    'mu'                    : 0.01,
+    'UP_den'                : 0.0,
+    'SP_den'                : 1.0,
+    'LM_visc'               : 30.0,
+    'tao_Y_OC'              : 'const_coh',
+
+    # solver options
+    'solver'                : 'fgmres',
+    'inner_rtol'            : 1e-3,     # float or 'default'
+    'outer_rtol'            : 1e-3,
+    'penalty_mg'            : 1.0e2,
+    'penalty_mumps'         : 1.0e6,
+    'loose_inner_rtol'      : 1e-2,     # A11 tolerance inside the Schur complement in loose_inner mode
+    'loose_restart'         : 10,       # gmres restart (stored krylov vectors) in loose_inner mode
+    'nonLinearMaxIterations': 20,
+
+    # boundary conditions
+    'bc_wanted'             : 'BC_FREESLIP',
+
+    # swarm
+    'particlesPerCell'      : 20,
+
+    # time stepping
+    'maxSteps'              : 2,
+    'steps_output'          : 1,
+
+    # diagnostics
+    'create_plot'           : False,
+    'lean_diagnostics'      : False,
+    'report_memory'         : True,
+    'benchmark_rheology'    : False,
+    # particle depth cached for the depth dependent yield stress instead of the sqrt of
+    # the coordinates; costs 8 bytes per particle, off until viscosity_benchmark shows a gain
+    'cache_depth'           : False,
+
+    # input (mesh, swarm, matVar, trench coords) and output locations
+    'input_root'            : '/scratch/n69/tg7098/spherical_swarm/',
+    'output_root'           : '/scratch/n69/tg7098/',
+
+    # benchmark mode: synthetic slab instead of the input_root data
+    'benchmark'             : False,
+    'benchmark_results'     : '',       # json lines file, default outputPath/benchmark.jsonl
+    'benchmark_scaling'     : '',       # 'strong' or 'weak' when run by run_benchmarks.py
+}
+
+# allowed values of the string options
+CHOICES = {
+    'tao_Y_OC'  : ('const_coh', 'coh_mu_rho_g_z', 'coh_mu_eff_rho_g_z'),
+    'solver'    : ('fgmres', 'lu', 'mumps', 'mg', 'slud', 'loose_inner'),
+    'bc_wanted' : ('BC_FREESLIP', 'BC_NOSLIP', 'BC_LIDDRIVEN', 'BC_SWIO_FREESLIP_NE_NOSLIP'),
+    'benchmark_scaling' : ('', 'strong', 'weak'),
+}
+
+# settings accepting an int or a float; ints keep their str() in the output path (e.g. _25)
+NUMBERS = ('crust_depth', 'sum_coh_dim', 'him_coh_dim')
+
+
+def read_config_file(path):
+    """
+    Reads settings from a .toml, .yaml or .yml file into a dict.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if ext in ('.yaml', '.yml'):
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+    raise ValueError("Can't read config file '{}', expected .toml, .yaml or .yml".format(path))
+
+
+def parse_override(item):
+    """
+    Parses a 'key=value' command line override, value follows TOML syntax
+    (e.g. resX=112, solver='loose_inner', lean_diagnostics=true); bare words are strings.
+    """
+    try:
+        import tomllib
+    except ImportError:
+        import tomli as tomllib
+    if '=' not in item:
+        raise ValueError("Override '{}' is not of the form key=value".format(item))
+    key, value = [s.strip() for s in item.split('=', 1)]
+    try:
+        value = tomllib.loads('value = '+value)['value']
+    except tomllib.TOMLDecodeError:
+        pass
+    return key, value
+
+
+def validate_config(settings):
+    """
+    Checks settings against DEFAULTS and CHOICES and returns a complete config
+    (defaults filled in, ints and numeric strings such as YAML 1.1 '1e-3'
+    converted where a float is expected).
+    Raises ValueError on unknown keys, wrong types or invalid options.
+    """
+    unknown = sorted(set(settings) - set(DEFAULTS))
+    if unknown:
+        raise ValueError("Unknown config keys: {}".format(', '.join(unknown)))
+
+    cfg = dict(DEFAULTS)
+    for key, value in settings.items():
+        default = DEFAULTS[key]
+        expected = 'int or float' if key in NUMBERS else type(default).__name__
+        if isinstance(default, float) and isinstance(value, str) and value != 'default':
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError("Config key '{}' = {!r} must be float".format(key, value))
+        if key == 'inner_rtol' and value == 'default':
+            pass
+        elif isinstance(default, bool) or isinstance(value, bool):
+            if not (isinstance(default, bool) and isinstance(value, bool)):
+                raise ValueError("Config key '{}' = {!r} must be {}".format(key, value, expected))
+        elif isinstance(default, float) and isinstance(value, int):
+            value = float(value)
+        elif key in NUMBERS and isinstance(value, (int, float)):
+            pass
+        elif not isinstance(value, type(default)):
+            raise ValueError("Config key '{}' = {!r} must be {}".format(key, value, expected))
+        cfg[key] = value
+
+    for key, choices in CHOICES.items():
+        if cfg[key] not in choices:
+            raise ValueError("Can't find an option for the '{}' = {}".format(key, cfg[key]))
+    for key in ('resX', 'resY', 'resZ', 'ncpus', 'maxSteps', 'steps_output', 'particlesPerCell',
+                'nonLinearMaxIterations', 'loose_restart'):
+        if cfg[key] < 1:
+            raise ValueError("Config key '{}' must be positive, got {}".format(key, cfg[key]))
+    for key in ('inner_rtol', 'outer_rtol', 'loose_inner_rtol'):
+        if cfg[key] != 'default' and not (0. < cfg[key] < 1.):
+            raise ValueError("Config key '{}' must be in (0, 1), got {}".format(key, cfg[key]))
+    for key in NUMBERS + ('mu', 'LM_visc', 'penalty_mg', 'penalty_mumps'):
+        if not (math.isfinite(cfg[key]) and cfg[key] >= 0):
+            raise ValueError("Config key '{}' must be finite and non-negative, got {}".format(key, cfg[key]))
+    if cfg['lon_min'] >= cfg['lon_max'] or cfg['lat_min'] >= cfg['lat_max']:
+        raise ValueError("Empty model region lon ({lon_min}, {lon_max}) lat ({lat_min}, {lat_max})".format(**cfg))
+    if cfg['benchmark'] and cfg['deform_mesh']:
+        raise ValueError("benchmark mode runs on the undeformed mesh, set deform_mesh = false")
+    return cfg
+
+
+def derive_paths(cfg):
+    """
+    Adds the resolution string 'res', 'file_str', 'outputPath' and 'inputPath'
+    to a validated config.
+    """
+    # resolution string
+    res = str(cfg['resZ'])+str(cfg['resX'])+str(cfg['resY'])+'_'+str(cfg['ncpus'])
+    if cfg['deform_mesh']:
+        res = res+'_'+'DMesh'
+
+    # adding string to output directory
+    file_str = str(res)+'_'+str(cfg['crust_depth'])+'_'+str(cfg['sum_coh_dim'])
+    if cfg['tao_Y_OC'] in ('coh_mu_rho_g_z', 'coh_mu_eff_rho_g_z'):
+        file_str = file_str+'_'+str(cfg['mu'])
+
+    cfg['res']          = res
+    cfg['file_str']     = file_str
+    cfg['outputPath']   = os.path.join(os.path.abspath(cfg['output_root']), "sum_sph_"+str(file_str)+"_"+str(cfg['tao_Y_OC'])
+                                       +"_UPDen_"+str(cfg['UP_den'])+"_SPDen_"+str(cfg['SP_den'])+"_LMVisc_"+str(int(cfg['LM_visc']))+"/")
+    cfg['inputPath']    = os.path.join(cfg['input_root'], 'swarm_'+str(res)+'/')
+    return cfg
+
+
+def load_config(path=None, overrides=()):
+    """
+    Returns the validated config of a run with derived paths.
+    path: .toml/.yaml file (None for the defaults)
+    overrides: iterable of 'key=value' strings applied on top of the file
+    """
+    settings = read_config_file(path) if path is not None else {}
+    settings.update(parse_override(item) for item in overrides)
+    return derive_paths(validate_config(settings))
@@ -0,0 +1,37 @@
+# coding: utf-8
+
+# # Coordinate conversions in the spherical region
+
+import math
+import numpy as np
+
+
+def sphxyz2sphlonlatr(xyz):
+    """
+    Function to convert (x,y,z) pts in spherical region to (lon, lat, radius) values in spherical region.
+    input data format = (x, y, z)
+    output data format = (lon, lat, radius)
+    """
+    ptsnew	= np.zeros((len(xyz[:,0]),3))
+    x_tanlon	= xyz[:,0]/xyz[:,2]
+    y_tanlat	= xyz[:,1]/xyz[:,2]
+    factor	= np.sqrt(x_tanlon**2 + y_tanlat**2 + 1)
+    ptsnew[:,2] = xyz[:,2] * factor
+    ptsnew[:,1] = np.arctan(y_tanlat) * (180/math.pi)
+    ptsnew[:,0] = np.arctan(x_tanlon) * (180/math.pi)
+    return ptsnew
+
+
+def sphlonlatr2sphxyz(data):
+    """
+    Converts (lon, lat, radius) in spherical region to (x, y, z) in spherical region.
+    input data format = (lon, lat, radius)
+    output data format = (x, y, z)
+    """
+    newcoords 		= np.zeros((len(data[:,0]),3))
+    (x,y) 		= (np.tan(data[:,0]*np.pi/180.0), np.tan(data[:,1]*np.pi/180.0))
+    d 			= data[:,2] / np.sqrt( x**2 + y**2 + 1)
+    newcoords[:,0] 	= d*x
+    newcoords[:,1] 	= d*y
+    newcoords[:,2] 	= d
+    return newcoords
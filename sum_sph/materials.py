@@ -0,0 +1,19 @@
+# coding: utf-8
+
+# # Material indices of materialVariable
+
+SubCrustIndex   = 4
+SubMantleIndex  = 3
+CCrustIndex     = 2
+CMantleIndex    = 1
+UMantleIndex    = 0
+HIMCrustIndex   = 5
+HIMLithoIndex   = 6
+LMantleIndex    = 8
+WeakPBBoxesIndex = 9
+
+# materials going through the nonlinear (yielding) branch of the viscosity map
+yieldingIndices = (SubCrustIndex, HIMCrustIndex)
+
+# crust and lithosphere of the subducting (Sunda) and HIM plates
+slabIndices     = (SubCrustIndex, SubMantleIndex, HIMCrustIndex, HIMLithoIndex)
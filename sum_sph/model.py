@@ -0,0 +1,845 @@
+# coding: utf-8
+
+# # 3D Subduction Model of Sunda Margin
+# The model is built from a config (see sum_sph.config) and run in phases:
+# setup(cfg) -> model, then solve(model), checkpoint(model) and advect(model)
+# in the time loop of run(cfg).
+
+import underworld as uw
+import math
+from underworld import function as fn
+import numpy as np
+import os
+os.environ["UW_ENABLE_TIMING"] = "1"
+import json
+import resource
+import subprocess
+from time import perf_counter
+
+from .geometry import sphxyz2sphlonlatr, sphlonlatr2sphxyz
+from .materials import (SubCrustIndex, SubMantleIndex, CCrustIndex, CMantleIndex, UMantleIndex,
+                        HIMCrustIndex, HIMLithoIndex, LMantleIndex, WeakPBBoxesIndex, yieldingIndices)
+
+
+# **Scaling of parameters**
+
+rho_M             = 1.
+g_M               = 1.
+Height_M          = 1.
+viscosity_M       = 1.
+
+rho_N             = 50.0 # kg/m**3  note delta rho
+g_N               = 9.81 # m/s**2
+Height_N          = 6371e3 # m
+viscosity_N       = 1e19 # Pa.sec or kg/m.sec
+
+#Non-dimensional (scaling)
+rho_scaling 		= rho_N/rho_M
+viscosity_scaling 	= viscosity_N/viscosity_M
+g_scaling 		= g_N/g_M
+Height_scaling 		= Height_N/Height_M
+pressure_scaling 	= rho_scaling * g_scaling * Height_scaling
+time_scaling 		= viscosity_scaling/pressure_scaling
+strainrate_scaling 	= 1./time_scaling
+velocity_scaling        = Height_scaling/time_scaling
+pressure_scaling_MPa    = rho_scaling * g_scaling * Height_scaling/1e6
+
+
+# \begin{align}
+# {\tau}_N = \frac{{\rho}_{0N}{g}_N{l}_N}{{\rho}_{0M}{g}_M{l}_M} {\tau}_M
+# \end{align}
+#
+# \begin{align}
+# {V}_N = \frac{{\eta}_{0M}}{{\eta}_{0N}}\frac{{\rho}_{0N}{g}_N{{l}_N}^2}{{\rho}_{0M}{g}_M{{l}_M}^2} {V}_M
+# \end{align}
+
+dim             = 3
+
+# viscosity values (lower mantle viscosity is set by LM_visc)
+upperMantleViscosity 	=  1.0
+slabMantleViscosity     =  1000.0
+slabCrustViscosity      =  1000.0
+CCrustViscosity         =  1000.0
+CMantleViscosity        =  1000.0
+WeakPBBoxesViscosity    =  10.0
+
+# choosing rheology
+viscoplastic 	= True
+Non_Newtonian 	= False
+
+
+class Model(object):
+    """
+    Holds the config, mesh, swarms, fields, functions and solvers of one run,
+    along with the model time and step.
+    """
+    def __init__(self, cfg):
+        self.cfg        = cfg
+        self.outputPath = cfg['outputPath']
+        self.time       = 0.  # Initial time
+        self.step       = 0   # Initial timestep
+        # wall time (s, max over ranks) of each phase, written out in benchmark mode
+        self.phaseTimes = {'setup': [], 'solve': [], 'checkpoint': [], 'update': []}
+        # peak resident memory (MB, max over ranks) of each solve and its increase over
+        # the pre-solve resident memory, written out in benchmark mode
+        self.solveMemory = {'solve_peak_MB': [], 'solve_increase_MB': [], 'solve_peak_reset': True}
+
+
+def synthetic_material(xyz, cfg):
+    """
+    Procedural stand-in for matVar_<res>_cor.h5 used in benchmark mode.
+    Subducting plate west of a N-S trench at the mid longitude with a slab dipping
+    east under the overriding plate; the northern part is Himalayan (HIM) lithosphere.
+    input data format = (x, y, z)
+    output data format = material index per point
+    """
+    diff_lat    = cfg['lat_max'] - cfg['lat_min']
+    crust_depth = cfg['crust_depth']
+    lonlatr     = sphxyz2sphlonlatr(xyz)
+    lon_km      = lonlatr[:,0]*(np.pi/180.)*6371.
+    depth       = (1. - lonlatr[:,2])*6371.
+    isHIM       = lonlatr[:,1] > 0.3*diff_lat
+    slab_top    = np.where(lon_km > 0., lon_km*np.tan(np.radians(45.)), 0.)
+    in_plate    = (depth >= slab_top) & (depth < slab_top+100.) & (slab_top < 400.)
+    in_crust    = in_plate & (depth < slab_top+crust_depth)
+
+    matVar                                  = np.full(len(xyz), UMantleIndex, dtype=np.int32)
+    matVar[depth > 660.]                    = LMantleIndex
+    matVar[(lon_km > 0.) & (depth < 100.)]  = CMantleIndex
+    matVar[(lon_km > 0.) & (depth < crust_depth)] = CCrustIndex
+    matVar[in_plate]                        = np.where(isHIM[in_plate], HIMLithoIndex, SubMantleIndex)
+    matVar[in_crust]                        = np.where(isHIM[in_crust], HIMCrustIndex, SubCrustIndex)
+    return matVar
+
+
+def synthetic_trench_coords(cfg, npoints=200):
+    """
+    Trench tracer coordinates (x, y, z) along the synthetic trench, split at the
+    Sunda/Himalaya boundary of synthetic_material.
+    """
+    diff_lat    = cfg['lat_max'] - cfg['lat_min']
+    radius      = 1. - 0.5*cfg['crust_depth']/6371.
+    lat_sum     = np.linspace(-0.45*diff_lat, 0.3*diff_lat, npoints)
+    lat_him     = np.linspace(0.3*diff_lat, 0.45*diff_lat, npoints)
+    sum_lonlatr = np.column_stack((np.zeros(npoints), lat_sum, np.full(npoints, radius)))
+    him_lonlatr = np.column_stack((np.zeros(npoints), lat_him, np.full(npoints, radius)))
+    return sphlonlatr2sphxyz(sum_lonlatr), sphlonlatr2sphxyz(him_lonlatr)
+
+
+def update_depth(m):
+    """
+    Stores depth (1 - radius) of every particle in depthVariable.
+    Call after the swarm has moved or been repopulated.
+    """
+    m.depthVariable.data[:,0] = 1. - np.linalg.norm(m.swarm.particleCoordinates.data, axis=1)
+
+
+def timed(m, phase, func):
+    """
+    Calls func() and appends its wall time (max over ranks) to m.phaseTimes[phase].
+    """
+    start  = perf_counter()
+    result = func()
+    m.phaseTimes[phase].append(max(uw.mpi.comm.allgather(perf_counter() - start)))
+    return result
+
+
+def memory_report(m, tag):
+    """
+    Reports the local memory (MB) held by every mesh and swarm variable, and the
+    particle coordinates of the swarm and trench tracers, on each rank.
+    Min/max/total over ranks are printed, the full per rank table is written to
+    outputPath/memoryReport.<tag>.csv. Transient checkpoint buffers and PETSc
+    matrices/vectors are not counted.
+    """
+    variables   = [(name, var) for name, var in sorted(vars(m).items())
+                   if isinstance(var, (uw.mesh.MeshVariable, uw.swarm.SwarmVariable))]
+    variables  += [(name+'.particleCoordinates', getattr(m, name).particleCoordinates)
+                   for name in ('swarm', 'sum_trench_tracer', 'him_trench_tracer')]
+    localBytes  = [var.data.nbytes for name, var in variables]
+    allBytes    = uw.mpi.comm.gather(localBytes, root=0)
+    if uw.mpi.rank == 0:
+        allMB   = np.array(allBytes)/1024.**2  # shape (nprocs, nvariables)
+        np.savetxt(m.outputPath+'memoryReport.'+str(tag)+'.csv', allMB, delimiter=',', fmt='%.3f',
+                   header=','.join(name for name, var in variables))
+        print ("---------------------------------Memory report ("+str(tag)+") in MB---------------------------------")
+        print ("(mesh/swarm variables and particle coordinates; transient checkpoint buffers and PETSc matrices not counted)")
+        print ('{0:38s} {1:>12s} {2:>12s} {3:>14s}'.format('variable', 'min/rank', 'max/rank', 'total'))
+        for i, (name, var) in enumerate(variables):
+            print ('{0:38s} {1:12.2f} {2:12.2f} {3:14.2f}'.format(name, allMB[:,i].min(), allMB[:,i].max(), allMB[:,i].sum()))
+        print ('{0:38s} {1:12.2f} {2:12.2f} {3:14.2f}'.format('all', allMB.sum(axis=1).min(), allMB.sum(axis=1).max(), allMB.sum()))
+
+
+def process_rss():
+    """
+    Returns (current, peak) resident memory (MB) of this process, read from
+    VmRSS/VmHWM in /proc/self/status; falls back to (nan, ru_maxrss).
+    """
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+        return float(status['VmRSS'].split()[0])/1024., float(status['VmHWM'].split()[0])/1024.
+    except (OSError, KeyError, ValueError):
+        return float('nan'), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.  # ru_maxrss in kB on linux
+
+
+def reset_peak_rss():
+    """
+    Resets the process peak resident memory (VmHWM) to the current one on
+    linux (>= 4.0). Returns False where this is not supported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def solve_report(m, solveTime, rssBefore, peakReset):
+    """
+    Prints the wall time of the last Stokes solve and the process peak resident
+    memory (MB) over ranks during it, with the increase over the resident memory
+    just before the solve, to compare solver options on the same problem.
+    Where the peak cannot be reset it is the process peak since start.
+    The max over ranks is appended to m.solveMemory.
+    """
+    rssAfter, peak = process_rss()
+    peaks, increases = np.array(uw.mpi.comm.allgather((peak, peak - rssBefore))).T
+    m.solveMemory['solve_peak_MB'].append(float(peaks.max()))
+    m.solveMemory['solve_increase_MB'].append(float(increases.max()))
+    m.solveMemory['solve_peak_reset'] = m.solveMemory['solve_peak_reset'] and peakReset
+    if uw.mpi.rank == 0:
+        label   = 'process peak RSS during solve' if peakReset else 'process peak RSS since start'
+        print ('solver = {0}; solve time = {1:.3e} s; {2} max/rank = {3:.1f} MB, total = {4:.1f} MB; '
+               'increase over pre-solve RSS max/rank = {5:.1f} MB, total = {6:.1f} MB'.format(
+               m.cfg['solver'], solveTime, label, peaks.max(), peaks.sum(), increases.max(), increases.sum()))
+
+
+def viscosity_benchmark(m, nrepeat=5):
+    """
+    Times viscosityFn evaluation over the whole swarm and reports viscosity
+    evaluations per second along with the number of yielding particles.
+    """
+    nYieldingLocal = int(np.isin(m.materialVariable.data[:,0], yieldingIndices).sum())
+    uw.mpi.barrier()
+    start = perf_counter()
+    for i in range(nrepeat):
+        m.viscosityFn.evaluate(m.swarm)
+    uw.mpi.barrier()
+    elapsed = perf_counter() - start
+    nParticles = uw.mpi.comm.allreduce(m.swarm.particleLocalCount)
+    nYielding  = uw.mpi.comm.allreduce(nYieldingLocal)
+    if uw.mpi.rank == 0:
+        print ('viscosity benchmark: tao_Y_OC = {0}; cache_depth = {1}; particles = {2:d}; yielding = {3:d}; time = {4:.3e} s; evaluations/s = {5:.3e}'.format(
+               m.cfg['tao_Y_OC'], m.cache_depth, nParticles, nYielding, elapsed/nrepeat, nrepeat*nParticles/elapsed))
+
+
+def setup(cfg):
+    """
+    Builds the model described by a validated config (sum_sph.config.load_config):
+    mesh, swarm and material, boundary conditions, rheology, Stokes solver,
+    advectors and checkpoint variables. Returns the Model.
+    """
+    setupStart  = perf_counter()
+    m           = Model(cfg)
+    outputPath  = m.outputPath
+
+    diff_lon 	= cfg['lon_max'] - cfg['lon_min']
+    diff_lat 	= cfg['lat_max'] - cfg['lat_min']
+    inner_radius    = (6371.-cfg['Mdepth'])/6371.
+    outer_radius    = 6371./6371.
+
+    # cohesion value and yield stress form
+    cohesion    = np.round(cfg['sum_coh_dim']/pressure_scaling_MPa, 4)
+    cohesion_him= np.round(cfg['him_coh_dim']/pressure_scaling_MPa, 4)
+    '''
+    tao_Y1: const_cohesion (C, constant cohesion in the crust)
+    tao_Y2: cohesion_mu_rho_g_z (C + mu_rho_g*depth, depth dependent yield stress)
+    tao_Y3: cohesion_mu_eff_rho_g_z (C + mu_eff*rho_g*depth, velocity weaking mu)
+    '''
+    tao_Y_OC    = cfg['tao_Y_OC']
+
+    # creating output directory
+    if uw.mpi.rank == 0:
+        if not os.path.exists(outputPath):
+            os.makedirs(outputPath)
+    uw.mpi.barrier()
+
+    # ### Create mesh and finite element variables
+    """
+    mesh information
+    nodes in each direction (8,12,12) = (radial, long, lat)
+    min number of nodes in lon lat direction such that no particle is eject from the spherical domain
+    """
+    m.mesh = mesh   = uw.mesh.FeMesh_SRegion(elementRes    =(cfg['resZ'],cfg['resX'],cfg['resY']),
+                                             radialLengths =(inner_radius, outer_radius),
+                                             latExtent     =diff_lat,
+                                             longExtent    =diff_lon)
+
+    # timing loading process
+    if uw.mpi.rank == 0:
+        print ("---------------------------------Start timer to load mesh data---------------------------------")
+    uw.timing.start()
+
+    if cfg['deform_mesh']:
+        mesh.load(cfg['inputPath']+'mesh_'+str(cfg['res'])+'.h5')
+
+    uw.timing.stop()
+    if uw.mpi.rank == 0:
+        print ("---------------------------------End timer to load mesh data---------------------------------")
+    uw.timing.print_table()
+
+    m.velocityField		= mesh.add_variable( nodeDofCount=dim )
+    m.pressureField		= mesh.subMesh.add_variable( nodeDofCount=1 )
+    m.densityField		= mesh.add_variable( nodeDofCount=1 )
+
+    m.vc			= vc = mesh.add_variable( nodeDofCount=dim ) #julesfix
+    vc_eqNum 		        = uw.systems.sle.EqNumber( vc, False )
+    m.vcVec			= uw.systems.sle.SolutionVector(vc, vc_eqNum)
+
+    #thyagi
+    m.strainRateInvField	= mesh.add_variable( nodeDofCount=1 )
+
+    # loading swarm and material variable
+    swarm_matVar_path   = cfg['inputPath']
+    m.swarm = swarm     = uw.swarm.Swarm(mesh, particleEscape=True)
+    if cfg['benchmark']:
+        swarm.populate_using_layout(uw.swarm.layouts.PerCellSpaceFillerLayout(swarm, particlesPerCell=cfg['particlesPerCell']))
+        m.materialVariable  = swarm.add_variable("int", 1)
+        m.materialVariable.data[:,0] = synthetic_material(swarm.particleCoordinates.data, cfg)
+    else:
+        swarm.load(swarm_matVar_path+'swarm_'+str(cfg['res'])+'.h5')
+        m.materialVariable  = swarm.add_variable("int", 1)
+        m.materialVariable.load(swarm_matVar_path+'matVar_'+str(cfg['res'])+'_cor.h5')
+    m.pol_con           = uw.swarm.PopulationControl(swarm, aggressive=True, particlesPerCell=cfg['particlesPerCell'])
+
+    # adding trench tracer and build a tracer swarm
+    if cfg['benchmark']:
+        sum_trench_coords, him_trench_coords = synthetic_trench_coords(cfg)
+    else:
+        region_str        = '{:d}_{:d}_{:d}_{:d}'.format(int(cfg['lon_min']), int(cfg['lon_max']), int(cfg['lat_min']), int(cfg['lat_max']))
+        sum_trench_coords = np.loadtxt(swarm_matVar_path+'sum_trench_coords_'+region_str+'.txt', delimiter=',')
+        him_trench_coords = np.loadtxt(swarm_matVar_path+'him_trench_coords_'+region_str+'.txt', delimiter=',')
+    m.sum_trench_tracer = uw.swarm.Swarm(mesh, particleEscape=True)
+    m.sum_trench_tracer.add_particles_with_coordinates(sum_trench_coords)
+    m.sum_trench_tracer_vel = m.sum_trench_tracer.add_variable( "double", 3 )
+
+    m.him_trench_tracer = uw.swarm.Swarm(mesh, particleEscape=True)
+    m.him_trench_tracer.add_particles_with_coordinates(him_trench_coords)
+    m.him_trench_tracer_vel = m.him_trench_tracer.add_variable( "double", 3 )
+
+    # all boundary nodes
+    inner = mesh.specialSets["innerWall_VertexSet"]
+    outer = mesh.specialSets["outerWall_VertexSet"]
+    W     = mesh.specialSets["westWall_VertexSet"]
+    E     = mesh.specialSets["eastWall_VertexSet"]
+    S     = mesh.specialSets["southWall_VertexSet"]
+    N     = mesh.specialSets["northWall_VertexSet"]
+
+    allWalls 	= mesh.specialSets["AllWalls_VertexSet"]
+    NS0 		= N+S-(E+W)
+    # build corner edges node indexset
+    cEdge 		= (N&W)+(N&E)+(S&E)+(S&W)
+
+    # boundary conditions
+    velocityField   = m.velocityField
+    bc_wanted       = cfg['bc_wanted']
+
+    # zero all dofs of velocityField
+    velocityField.data[...] = 0.
+
+    if bc_wanted == "BC_NOSLIP":
+        # No-slip on all sides; normal component = 0 and tagential component = 0
+        m.velBC = uw.conditions.RotatedDirichletCondition(variable=velocityField, indexSetsPerDof=(allWalls,allWalls,allWalls))
+
+    elif bc_wanted == "BC_FREESLIP":
+        # free-slip on all sides; normal component = 0 and tagential component != 0
+        velocityField.data[cEdge.data] = (0.,0.,0.)
+        m.velBC = uw.conditions.RotatedDirichletCondition(variable=velocityField, indexSetsPerDof=(inner+outer,E+W+cEdge,NS0+cEdge), basis_vectors=(mesh._e1, mesh._e2, mesh._e3))
+    elif bc_wanted == "BC_LIDDRIVEN":
+        # lid-driven case
+
+        # build driving node indexset & apply velocities with zero radial component
+        drivers = outer - (N+S+E+W)
+        velocityField.data[drivers.data] = (0.,1.,1.)
+
+        # build corner edges node indexset and apply velocities with zero non-radial components
+        velocityField.data[cEdge.data] = (0.,0.,0.)
+
+        # apply altogether.
+        m.velBC = uw.conditions.RotatedDirichletCondition(variable=velocityField, indexSetsPerDof=(inner+outer,drivers+E+W+cEdge,drivers+NS0+cEdge), basis_vectors = (mesh._e1, mesh._e2, mesh._e3)) # optional, can include cEdge on the 3rd component
+
+    elif bc_wanted == "BC_SWIO_FREESLIP_NE_NOSLIP":
+        velocityField.data[cEdge.data] = (0.,0.,0.)
+        m.velBC = uw.conditions.RotatedDirichletCondition(variable=velocityField, indexSetsPerDof=(N+E+outer+inner,N+E+cEdge+W,N+E+cEdge+S), basis_vectors = (mesh._e1, mesh._e2, mesh._e3))
+    else:
+        raise ValueError("Can't find an option for the 'bc_wanted' = {}".format(bc_wanted))
+
+    # julesfix - use the pure cartesian velocity instead
+    m.strainRate_2ndInvariant = strainRate_2ndInvariant = fn.tensor.second_invariant(fn.tensor.symmetric(vc.fn_gradient))
+
+    # with cache_depth the depth of each particle is cached (8 bytes per particle), it does
+    # not change within a nonlinear solve; otherwise it is computed from the coordinates
+    depth_dependent = tao_Y_OC in ('coh_mu_rho_g_z', 'coh_mu_eff_rho_g_z')
+    m.cache_depth   = depth_dependent and cfg['cache_depth']
+    if m.cache_depth:
+        m.depthVariable = swarm.add_variable("double", 1)
+        update_depth(m)
+        depthFn     = m.depthVariable
+    elif depth_dependent:
+        coord       = fn.input()
+        depthFn     = 1. - fn.math.sqrt(coord[0]**2. + coord[1]**2. + coord[2]**2.)
+
+    # rheology1: viscoplastic crust and rest is newtonian
+    if tao_Y_OC == 'const_coh':
+        cohesion_slab 	= cohesion
+        tao_Y_slab 		= cohesion_slab
+        tao_Y_slab_him      = cohesion_him
+    if tao_Y_OC == 'coh_mu_rho_g_z':
+        cohesion_slab 	= cohesion
+        mu_rho_g 		= cfg['mu']*1.0*1.  # mu = 0.6, rho = 3300, g = 9.81
+        tao_Y_slab = cohesion_slab  + mu_rho_g *depthFn
+        tao_Y_slab_him      = cohesion_him  + mu_rho_g *depthFn
+    if tao_Y_OC == 'coh_mu_eff_rho_g_z':
+        cohesion_slab 	= cohesion
+        vc_crit 		= (4.4/(velocity_scaling))*(10e-2/(365*24*60*60)) # v_crit = 4.4 cm/yr
+        vc_mag 		= fn.math.sqrt(fn.math.dot(vc,vc))
+        mu_eff 		= 0.6*(1.-0.7) + 0.6*(0.7/(1.+(vc_mag/vc_crit)))  # mu_s*(1-gamma) + mu_s*(gamma/(1+(v/vc)))
+        rho_g 		= 1.0*1.  # mu = 0.6, rho = 3300, g = 9.81
+        tao_Y_slab 		= cohesion_slab  + mu_eff*rho_g *depthFn
+        tao_Y_slab_him      = cohesion_him  + mu_eff*rho_g *depthFn
+    yielding_slab       = 0.5 * tao_Y_slab / (strainRate_2ndInvariant+1.0e-18)
+    yielding_slab_him   = 0.5 * tao_Y_slab_him / (strainRate_2ndInvariant+1.0e-18)
+
+    # all are Newtonian except viscoplastic oceanic crust
+    eta_min = upperMantleViscosity
+    eta_max = slabCrustViscosity
+    if viscoplastic:
+        slabYieldvisc = fn.exception.SafeMaths(fn.misc.max(eta_min, fn.misc.min(slabCrustViscosity, yielding_slab)))
+        slabYieldvisc_him = fn.exception.SafeMaths(fn.misc.max(eta_min, fn.misc.min(slabCrustViscosity, yielding_slab_him)))
+
+    # Non-Newtonian and viscoplastic crust (~30km) and Newtonian mantle
+    if Non_Newtonian:
+        n 			= 3.
+        sr_T 		= 1e-4
+        creep_dislocation 	= slabMantleViscosity * fn.math.pow(((strainRate_2ndInvariant+1.0e-18)/sr_T), (1.-n)/n)
+        creep 		= fn.exception.SafeMaths(fn.misc.min(creep_dislocation,slabMantleViscosity))
+        slabYieldvisc 	= fn.exception.SafeMaths(fn.misc.min(creep, yielding_slab))
+
+    # Viscosity function for the materials
+    # fn.branching.map evaluates only the entry of each particle's key, so the
+    # yielding chain above is evaluated only for particles in yieldingIndices
+    viscosityMap 	= { UMantleIndex    : upperMantleViscosity,
+                        LMantleIndex    : cfg['LM_visc'],
+                        SubCrustIndex   : slabYieldvisc,
+                        SubMantleIndex  : slabMantleViscosity,
+                        CCrustIndex	    : CCrustViscosity,
+                        CMantleIndex    : CMantleViscosity,
+                        HIMCrustIndex   : slabYieldvisc_him,
+                        HIMLithoIndex   : slabMantleViscosity,
+                        WeakPBBoxesIndex: WeakPBBoxesViscosity}
+
+    m.viscosityFn 	= viscosityFn = fn.branching.map( fn_key = m.materialVariable, mapping = viscosityMap )
+
+    # mantleDensity = densityField
+    mantleDensity 	= 0.0
+    slabDensity 	= cfg['SP_den']
+    CCrustDensity 	= cfg['UP_den']
+    HIMDensity      = cfg['SP_den']
+    densityMap 	= { UMantleIndex 	: mantleDensity,
+                        LMantleIndex 	: mantleDensity,
+                        SubCrustIndex       : slabDensity,
+                        SubMantleIndex      : slabDensity,
+                        CCrustIndex		: CCrustDensity,
+                        CMantleIndex	: CCrustDensity,
+                        HIMCrustIndex       : HIMDensity,
+                        HIMLithoIndex       : HIMDensity,
+                        WeakPBBoxesIndex    : mantleDensity}
+
+    m.densityFn   	= fn.branching.map( fn_key = m.materialVariable, mapping = densityMap )
+
+    buoyancyFn = -1.*m.densityFn * mesh.fn_unitvec_radial()
+
+    # **System Setup**
+    m.stokesSLE = uw.systems.Stokes(velocityField,
+                                    m.pressureField,
+                                    fn_viscosity	= viscosityFn + 0.*velocityField[0], # julesfix - ensures the nonlinearity is pickedup
+#                                     voronoi_swarm = swarm,
+                                    fn_bodyforce	= buoyancyFn,
+                                    conditions	= m.velBC,
+                                    _removeBCs	= False )
+
+    m.stokesSolver = stokesSolver = uw.systems.Solver(m.stokesSLE)
+
+    # inner solver type
+    """
+    solver: mg, fgmres, mumps(not working), slud (superludist),
+            loose_inner (fgmres with the velocity block solves applied inside the Schur
+            complement operator at loose_inner_rtol; the Schur RHS pre-solve and the final
+            velocity back-solve get their own KSPs at inner_rtol, so the returned velocity
+            and pressure keep the fgmres tolerances. Same double precision, fewer A11
+            iterations per outer iteration at the cost of more outer iterations)
+    """
+    solver = cfg['solver']
+    if solver == 'fgmres':
+        pass
+    if solver == 'lu':
+        stokesSolver.set_inner_method("lu")
+    if solver == 'mumps':
+        stokesSolver.set_penalty(cfg['penalty_mumps'])
+        stokesSolver.set_inner_method("mumps")
+    if solver == 'mg':
+        stokesSolver.set_penalty(cfg['penalty_mg'])
+        stokesSolver.set_inner_method("mg")
+    #     stokesSolver.options.mg.levels = 6
+    if solver == 'slud':
+        stokesSolver.set_inner_method('superludist')
+    if solver == 'loose_inner':
+        # shorter gmres restarts keep fewer krylov vectors per block
+        stokesSolver.options.A11.ksp_gmres_restart  = cfg['loose_restart']
+        stokesSolver.options.scr.ksp_gmres_restart  = cfg['loose_restart']
+
+    # rtol value
+    if cfg['inner_rtol'] != 'default':
+        stokesSolver.set_inner_rtol(cfg['inner_rtol'])
+        stokesSolver.set_outer_rtol(cfg['outer_rtol'])
+    if solver == 'loose_inner':
+        # only the A11 solve applied inside the Schur complement operator is loosened.
+        # Without change_backsolve/change_A11rhspresolve the back-solve and the RHS
+        # pre-solve reuse the A11 KSP, so they get their own KSPs at the A11 tolerance
+        # fgmres would use (PETSc default 1e-5 where inner_rtol is 'default')
+        inner_rtol = getattr(stokesSolver.options.A11, 'ksp_rtol', 1e-5)
+        stokesSolver.options.main.change_backsolve      = True
+        stokesSolver.options.main.change_A11rhspresolve = True
+        stokesSolver.options.backsolveA11.ksp_rtol      = inner_rtol
+        stokesSolver.options.rhsA11.ksp_rtol            = inner_rtol
+        stokesSolver.options.A11.ksp_rtol               = cfg['loose_inner_rtol']
+
+    m.advector = uw.systems.SwarmAdvector(swarm=swarm, velocityField=vc, order=2) #julesfix
+    m.advector_sum_trench_tracer = uw.systems.SwarmAdvector( swarm=m.sum_trench_tracer, velocityField=vc, order=2)
+    m.advector_him_trench_tracer = uw.systems.SwarmAdvector( swarm=m.him_trench_tracer, velocityField=vc, order=2)
+
+    # **Analysis tools**
+
+    #The root mean square Velocity
+    m.velSquared 	= uw.utils.Integral(fn.math.dot(vc,vc), mesh)
+    m.area 		= uw.utils.Integral(1., mesh)
+
+    if cfg['create_plot']:
+        import glucifer
+        # plotting indexed particles
+        m.figParticle = glucifer.Figure(title="Particle Index" )
+        m.figParticle.append( glucifer.objects.Points(swarm, m.materialVariable, pointSize=2,
+                                                      colours='white green red purple blue', discrete=True) )
+
+        #Plot of Velocity Magnitude
+        m.figVelocityMag = glucifer.Figure(title="Velocity magnitude"+'_'+str(cohesion) )
+        m.figVelocityMag.append( glucifer.objects.Surface(mesh, fn.math.sqrt(fn.math.dot(vc,vc)), onMesh=True) ) #julesfix
+
+        #Plot of Strain Rate, 2nd Invariant
+        m.figStrainRate = glucifer.Figure(title="Strain rate 2nd invariant"+'_'+str(cohesion), quality=3 )
+        m.figStrainRate.append( glucifer.objects.Surface(mesh, strainRate_2ndInvariant, logScale=True, onMesh=True) )
+        m.figStrainRate.append( glucifer.objects.VectorArrows(mesh, vc, scaling=1, arrowHead=0.2) ) #julesfix
+
+        #Plot of particles viscosity
+        m.figViscosity = glucifer.Figure(title="Viscosity"+'_'+str(cohesion), quality=3 )
+        m.figViscosity.append( glucifer.objects.Points(swarm, viscosityFn, pointSize=2,logScale=True ) )
+
+        #Plot of particles stress invariant
+        m.figStress = glucifer.Figure(title="Stress 2nd invariant"+'_'+str(cohesion), quality=3  )
+        m.figStress.append(glucifer.objects.Points(swarm, 2.0*viscosityFn*strainRate_2ndInvariant, pointSize=2, logScale=True) )
+
+    # variables in checkpoint function
+    # Creating viscosity Field
+    m.viscosityField       = mesh.add_variable(nodeDofCount=1)
+    m.viscosityVariable    = swarm.add_variable(dataType="float", count=1)
+
+    # creating material variable field
+    m.matVarField          = mesh.add_variable(nodeDofCount=1)
+    # global id of the element owning each particle (4 bytes per particle), checkpointed
+    # for the per element material fractions of the post-processing
+    m.owningElementVariable = swarm.add_variable("int", 1)
+
+    # Creating strain rate and stress fn
+    m.strainRateFn         = fn.tensor.symmetric(vc.fn_gradient)
+    m.stressFn             = 2. * viscosityFn * m.strainRateFn
+    m.stressInvFn          = fn.tensor.second_invariant(m.stressFn)
+
+    m.stressInvField_sMesh = mesh.subMesh.add_variable(nodeDofCount=1) # creating field on submesh
+    m.stressField_sMesh    = mesh.subMesh.add_variable(nodeDofCount=6) # stress components
+
+    if cfg['lean_diagnostics']:
+        # one scratch field shared by all diagonal/non-diagonal outputs
+        m.diagScratchField     = mesh.add_variable(nodeDofCount=3)
+    else:
+        m.strainRateDField     = mesh.add_variable(nodeDofCount=3)
+        m.strainRateNDField    = mesh.add_variable(nodeDofCount=3)
+        m.strainRateVariable   = swarm.add_variable(dataType="float", count=6) # strain rate variable
+
+        m.stressInvVariable    = swarm.add_variable(dataType="float", count=1) # stress Inv variable
+        m.stressVariable       = swarm.add_variable(dataType="float", count=6) # stress variable
+        m.stressDField         = mesh.add_variable(nodeDofCount=3) # stress diagonal components
+        m.stressNDField        = mesh.add_variable(nodeDofCount=3) # stress non-diagonal components
+
+    #creating density variable
+    m.densityVariable      = swarm.add_variable("float", 1)
+
+    m.meshHnd = mesh.save(outputPath+'mesh.00000.h5')
+
+    if cfg['report_memory']:
+        memory_report(m, 'setup')
+
+    m.phaseTimes['setup'].append(max(uw.mpi.comm.allgather(perf_counter() - setupStart)))
+    return m
+
+
+def postSolve(m):
+    #julesfix realign vc using the rotation matrix on stokes
+    uw.libUnderworld.Underworld.AXequalsY(
+        m.stokesSLE._rot._cself,
+        m.stokesSLE._velocitySol._cself,
+        m.vcVec._cself,
+        False
+        )
+
+
+def solve(m):
+    """
+    Solves the non linear Stokes system and realigns vc.
+    """
+    peakReset   = reset_peak_rss()
+    rssBefore   = process_rss()[0]
+    timed(m, 'solve', lambda: m.stokesSolver.solve(nonLinearIterate=True, callback_post_solve=lambda: postSolve(m), print_stats=True,
+                                                   nonLinearMaxIterations=m.cfg['nonLinearMaxIterations']))
+    solve_report(m, m.phaseTimes['solve'][-1], rssBefore, peakReset)
+    if m.cfg['benchmark_rheology'] and m.step == 0:
+        viscosity_benchmark(m)
+
+
+def advect(m):
+    """
+    Advects the swarm and trench tracers with the maximum stable timestep
+    and advances the model time and step.
+    """
+    # Retrieve the maximum possible timestep for the advection system.
+    dt = m.advector.get_max_dt()
+    # Advect using this timestep size.
+    m.advector.integrate(dt)
+    m.advector_sum_trench_tracer.integrate(dt)
+    m.advector_him_trench_tracer.integrate(dt)
+    if m.cache_depth:
+        update_depth(m)
+    m.time = m.time+dt
+    m.step = m.step+1
+
+
+def checkpoint(m):
+    """
+    Saves the swarm, material, velocity, pressure and the derived density,
+    strain rate, viscosity and stress fields of the current step.
+    """
+    outputPath  = m.outputPath
+    meshHnd     = m.meshHnd
+    mesh, swarm = m.mesh, m.swarm
+    step_str    = str(m.step).zfill(5)
+    modeltime   = m.time
+
+    # save swarm and swarm variables
+    swarmHnd            = swarm.save(outputPath+'swarm.'+step_str+'.h5')
+    materialVariableHnd = m.materialVariable.save(outputPath+'materialVariable.'+ step_str +'.h5')
+    m.owningElementVariable.data[:,0] = mesh.data_elgId[swarm.owningCell.data[:,0]]
+    m.owningElementVariable.save(outputPath+'owningElement.'+ step_str +'.h5')
+
+    # projecting matvar to mesh field
+    matVar_projector    = uw.utils.MeshVariable_Projection(m.matVarField, m.materialVariable, type=0)
+    matVar_projector.solve()
+    matVarFieldHnd      = m.matVarField.save(outputPath+'matVarField.'+step_str+'.h5')
+    m.matVarField.xdmf(outputPath+'matVarField.'+step_str+'.xdmf', matVarFieldHnd, "matVarField", meshHnd, "mesh", modeltime=modeltime)
+
+    # saving velocity field in xyz format
+    velocityHnd     = m.vc.save(outputPath+'velocityField.'+step_str+'.h5', meshHnd) #julesfix
+    m.vc.xdmf(outputPath+'velocityField.'+step_str+'.xdmf', velocityHnd, "velocity", meshHnd, "mesh", modeltime=modeltime) #julesfix
+
+    # saving velocity field in rthetaphi format
+    v_rthetaphi_Hnd = m.velocityField.save(outputPath+'vField_rthetaphi.'+step_str+'.h5', meshHnd)
+
+    # saving pressure field
+    pressureHnd     = m.pressureField.save(outputPath+'pressureField.'+step_str+'.h5', meshHnd)
+    m.pressureField.xdmf(outputPath+'pressureField.'+step_str+'.xdmf', pressureHnd, "pressure", meshHnd, "mesh", modeltime=modeltime)
+
+    # saving trench tracer positions (trench migration in post-processing)
+    m.sum_trench_tracer.save(outputPath+'sum_trench_coords.'+step_str+'.h5')
+    m.him_trench_tracer.save(outputPath+'him_trench_coords.'+step_str+'.h5')
+
+    # save visualisation
+    if m.cfg['create_plot']:
+        m.figParticle.save(    outputPath + "particle."    + step_str)
+        m.figVelocityMag.save( outputPath + "velocityMag." + step_str)
+        m.figStrainRate.save(  outputPath + "strainRate."  + step_str)
+        m.figViscosity.save(   outputPath + "viscosity."   + step_str)
+        m.figStress.save(      outputPath + "stress."      + step_str)
+
+    # saving density Field
+    m.densityVariable.data[:]   = m.densityFn.evaluate(swarm)[:]
+    den_projector               = uw.utils.MeshVariable_Projection(m.densityField, m.densityVariable, type=0)
+    den_projector.solve()
+    densityFieldHnd             = m.densityField.save(outputPath+'densityField.'+ step_str +'.h5')
+    m.densityField.xdmf(outputPath+'densityField.'+step_str+'.xdmf', densityFieldHnd,"densityField",meshHnd,"mesh",modeltime=modeltime)
+
+    # saving strainrate invariant field
+    m.strainRateInvField.data[:]  = m.strainRate_2ndInvariant.evaluate(mesh)[:]
+    strainRateInvFieldHnd       = m.strainRateInvField.save(outputPath+'strainRateInvField.'+step_str+'.h5', meshHnd)
+    m.strainRateInvField.xdmf(outputPath+'strainRateInvField.'+step_str+'.xdmf', strainRateInvFieldHnd, "strainRateInv", meshHnd, "mesh", modeltime=modeltime)
+
+    # saving viscosity variable (swarm) and field (mesh)
+    m.viscosityVariable.data[:] = m.viscosityFn.evaluate(swarm)[:]
+    viscosityVariableHnd        = m.viscosityVariable.save(outputPath+'viscosityVariable.'+ step_str +'.h5')
+    visc_projector              = uw.utils.MeshVariable_Projection(m.viscosityField, m.viscosityVariable, type=0) # Project to meshfield
+    visc_projector.solve()
+    viscosityFieldHnd           = m.viscosityField.save(outputPath+'viscosityField.'+step_str+'.h5')
+    m.viscosityField.xdmf(outputPath+'viscosityField.'+step_str+'.xdmf', viscosityFieldHnd, "viscosityField", meshHnd, "mesh", modeltime=modeltime)
+
+    if m.cfg['lean_diagnostics']:
+        # strain rate evaluated once into a transient buffer and written through the scratch field
+        strainRateBuf               = m.strainRateFn.evaluate(mesh)
+        for fieldName, cols in (('strainRateDField', slice(0,3)), ('strainRateNDField', slice(3,6))):
+            m.diagScratchField.data[:]  = strainRateBuf[:,cols]
+            diagScratchFieldHnd         = m.diagScratchField.save(outputPath+fieldName+'.'+step_str+'.h5')
+            m.diagScratchField.xdmf(outputPath+fieldName+'.'+step_str+'.xdmf', diagScratchFieldHnd, fieldName, meshHnd, "mesh", modeltime=modeltime)
+        del strainRateBuf
+
+        # stress projected straight from the function, no per particle stress is stored
+        stress_proj                 = uw.utils.MeshVariable_Projection(m.stressField_sMesh, m.stressFn, voronoi_swarm=swarm, type=0)
+        stress_proj.solve()
+        stressBuf                   = m.stressField_sMesh.evaluate(mesh)
+        for fieldName, cols in (('stressDField', slice(0,3)), ('stressNDField', slice(3,6))):
+            m.diagScratchField.data[:]  = stressBuf[:,cols]
+            diagScratchFieldHnd         = m.diagScratchField.save(outputPath+fieldName+'.'+step_str+'.h5')
+            m.diagScratchField.xdmf(outputPath+fieldName+'.'+step_str+'.xdmf', diagScratchFieldHnd, fieldName, meshHnd, "mesh", modeltime=modeltime)
+        del stressBuf
+
+        # saving stress Invariant on submesh
+        stress_Inv_proj             = uw.utils.MeshVariable_Projection(m.stressInvField_sMesh, m.stressInvFn, voronoi_swarm=swarm, type=0)
+        stress_Inv_proj.solve()
+        stressInvField_sMeshHnd     = m.stressInvField_sMesh.save(outputPath+'stressInvField_sMesh.'+step_str+'.h5')
+        m.stressInvField_sMesh.xdmf(outputPath+'stressInvField_sMesh.'+step_str+'.xdmf', stressInvField_sMeshHnd, "stressInvField_sMesh", meshHnd, "mesh", modeltime=modeltime)
+        return
+
+    # saving strain rate variable (swarm) and field (mesh)
+    m.strainRateVariable.data[:]  = m.strainRateFn.evaluate(swarm)[:]
+    strainRateVariableHnd       = m.strainRateVariable.save(outputPath+'strainRateVariable.'+ step_str +'.h5')
+    m.strainRateDField.data[:]  = m.strainRateFn.evaluate(mesh)[:,0:3]
+    m.strainRateNDField.data[:] = m.strainRateFn.evaluate(mesh)[:,3:6]
+    strainRateDFieldHnd         = m.strainRateDField.save(outputPath+'strainRateDField.'+step_str+'.h5')
+    m.strainRateDField.xdmf(outputPath+'strainRateDField.'+step_str+'.xdmf', strainRateDFieldHnd,"strainRateDField",meshHnd,"mesh",modeltime=modeltime)
+    strainRateNDFieldHnd        = m.strainRateNDField.save(outputPath+'strainRateNDField.'+ step_str +'.h5')
+    m.strainRateNDField.xdmf(outputPath+'strainRateNDField.'+step_str+'.xdmf', strainRateNDFieldHnd,"strainRateNDField",meshHnd,"mesh",modeltime=modeltime)
+
+    # saving stress variable (swarm) and field (submesh)
+    m.stressVariable.data[:]    = m.stressFn.evaluate(swarm)[:]
+    stressVariableHnd           = m.stressVariable.save(outputPath+'stressVariable.'+ step_str +'.h5')
+    stress_proj                 = uw.utils.MeshVariable_Projection(m.stressField_sMesh, m.stressVariable, voronoi_swarm=swarm, type=0)
+    stress_proj.solve()
+    m.stressDField.data[:]      = m.stressField_sMesh.evaluate(mesh)[:,0:3]
+    m.stressNDField.data[:]     = m.stressField_sMesh.evaluate(mesh)[:,3:6]
+    stressDFieldHnd             = m.stressDField.save(outputPath+'stressDField.'+step_str+'.h5')
+    m.stressDField.xdmf(outputPath+'stressDField.'+step_str+'.xdmf', stressDFieldHnd, "stressDField", meshHnd, "mesh", modeltime=modeltime)
+    stressNDFieldHnd            = m.stressNDField.save(outputPath+'stressNDField.'+step_str+'.h5')
+    m.stressNDField.xdmf(outputPath+'stressNDField.'+step_str+'.xdmf', stressNDFieldHnd, "stressNDField", meshHnd, "mesh", modeltime=modeltime)
+
+    # saving stress Invariant on submesh
+    m.stressInvVariable.data[:] = m.stressInvFn.evaluate(swarm)[:]
+    stress_Inv_proj             = uw.utils.MeshVariable_Projection(m.stressInvField_sMesh, m.stressInvVariable, voronoi_swarm=swarm, type=0)
+    stress_Inv_proj.solve()
+    stressInvField_sMeshHnd     = m.stressInvField_sMesh.save(outputPath+'stressInvField_sMesh.'+step_str+'.h5')
+    m.stressInvField_sMesh.xdmf(outputPath+'stressInvField_sMesh.'+step_str+'.xdmf', stressInvField_sMeshHnd, "stressInvField_sMesh", meshHnd, "mesh", modeltime=modeltime)
+
+
+def finalise(m):
+    """
+    Prints the solver options, saves the trench tracer velocities and, in
+    benchmark mode, appends the phase timings as one json record.
+    """
+    outputPath = m.outputPath
+    if uw.mpi.rank == 0:
+        print("Inner (velocity) Solve Options:")
+        m.stokesSolver.options.A11.list()
+        print('----------------------------------')
+        print("Outer Solve Options:")
+        m.stokesSolver.options.scr.list()
+        print('----------------------------------')
+        print("Multigrid (where enabled) Options:")
+        m.stokesSolver.options.mg.list()
+
+    # **Post simulation visualisation**
+    if m.cfg['create_plot']:
+        m.figParticle.show()
+        m.figVelocityMag.show()
+        m.figStrainRate.show()
+        m.figViscosity.show()
+        m.figStress.show()
+
+    # saving sum trench velocities to h5 file
+    m.sum_trench_tracer_vel.data[:] = m.vc.evaluate(m.sum_trench_tracer.data)[:]
+    m.sum_trench_tracer_vel.save(outputPath+'sum_trench_velocities.h5')
+    m.sum_trench_tracer.save(outputPath+'sum_trench_coords.h5')
+
+    m.him_trench_tracer_vel.data[:] = m.vc.evaluate(m.him_trench_tracer.data)[:]
+    m.him_trench_tracer_vel.save(outputPath+'him_trench_velocities.h5')
+    m.him_trench_tracer.save(outputPath+'him_trench_coords.h5')
+
+    # benchmark results, one json record per run appended to benchmark_results
+    nParticles = uw.mpi.comm.allreduce(m.swarm.particleLocalCount)
+    if m.cfg['benchmark'] and uw.mpi.rank == 0:
+        cfg = m.cfg
+        repoDir = os.path.dirname(os.path.abspath(__file__))
+        try:
+            commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repoDir,
+                                             stderr=subprocess.DEVNULL).decode().strip()
+            # uncommitted changes to tracked files
+            dirty  = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repoDir,
+                                             stderr=subprocess.DEVNULL).strip() != b''
+        except (OSError, subprocess.CalledProcessError):
+            commit, dirty = None, None
+        record = {'commit': commit, 'dirty': dirty, 'scaling': cfg['benchmark_scaling'], 'nprocs': uw.mpi.size,
+                  'res': [cfg['resZ'], cfg['resX'], cfg['resY']], 'elements': cfg['resZ']*cfg['resX']*cfg['resY'],
+                  'particles': nParticles, 'solver': cfg['solver'], 'steps': cfg['maxSteps']}
+        record.update(m.phaseTimes)
+        record.update(m.solveMemory)
+        with open(cfg['benchmark_results'] or outputPath+'benchmark.jsonl', 'a') as f:
+            f.write(json.dumps(record)+'\n')
+
+
+# Main simulation loop
+# =======
+#
+# The main time stepping loop begins here. Inside the time loop the velocity field is solved for via the Stokes system solver and then the swarm is advected using the advector integrator. Basic statistics are output to screen each timestep.
+
+def run(cfg):
+    """
+    Runs the model of a validated config for maxSteps steps, checkpointing
+    every steps_output steps and at the last step. Returns the Model.
+    """
+    m = setup(cfg)
+    maxSteps, steps_output = cfg['maxSteps'], cfg['steps_output']
+    while m.step < maxSteps:
+        # Solve non linear Stokes system
+        solve(m)
+        # output figure to file at intervals = steps_output
+        if m.step % steps_output == 0 or m.step == maxSteps-1:
+            m.pol_con.repopulate()
+            if m.cache_depth:
+                update_depth(m)
+            timed(m, 'checkpoint', lambda: checkpoint(m))
+            if cfg['report_memory']:
+                memory_report(m, str(m.step).zfill(5))
+            Vrms = math.sqrt( m.velSquared.evaluate()[0]/m.area.evaluate()[0] )
+            if uw.mpi.rank==0:
+                print ('step = {0:6d}; time = {1:.3e}; Vrms = {2:.3e}'.format(m.step,m.time,Vrms))
+                with open(m.outputPath+'Vrms.txt', 'a') as f:
+                    f.write('{0:d} {1:.6e} {2:.6e}\n'.format(m.step,m.time,Vrms))
+        # update
+        timed(m, 'update', lambda: advect(m))
+    finalise(m)
+    return m
@@ -0,0 +1,278 @@
+# coding: utf-8
+
+# # Post-processing of a checkpoint series
+# Streams velocityField, swarm/materialVariable/owningElement, stressInvField_sMesh
+# and trench tracer files of every checkpointed step in chunks (hyperslab reads), runs the
+# per step reductions in a process pool and writes one summary.h5 time series:
+#     python -m sum_sph.postprocess <outputPath or config> --workers 8
+#
+# vrms is the volume integrated Vrms the run logs to Vrms.txt, vrms_nodal the
+# plain rms over mesh nodes.
+# lon, lat are model coordinates of the spherical region (sphxyz2sphlonlatr),
+# depths in km, velocities and stresses in model units.
+
+import argparse
+import contextlib
+import glob
+import multiprocessing
+import os
+import re
+
+import h5py
+import numpy as np
+
+from .config import load_config
+from .geometry import sphxyz2sphlonlatr
+from .materials import SubCrustIndex, slabIndices
+
+# depth bins (km) of the slab stress invariant profile
+DEPTH_BINS      = (0., 50., 100., 150., 200., 300., 400., 500., 660., 1000., 2891.)
+# latitude bins (deg, model coordinates) and depth range (km) of the slab dip plane fit
+LAT_BINS        = tuple(np.linspace(-40., 40., 9))
+DIP_DEPTHS      = (50., 200.)
+
+# element centroids (lon km, depth km) of mesh.00000.h5, cached next to it
+element_centroid_file = 'mesh.00000.elementCentroid.npy'
+
+
+def checkpoint_steps(outputPath):
+    """
+    Returns the sorted step strings (NNNNN) of the velocityField checkpoints.
+    """
+    files = glob.glob(os.path.join(outputPath, 'velocityField.*.h5'))
+    return sorted(re.search(r'velocityField\.(\d+)\.h5$', f).group(1) for f in files)
+
+
+def checkpoint_time(outputPath, step_str):
+    """
+    Model time of a checkpoint, read from its velocityField xdmf (nan if missing).
+    """
+    try:
+        with open(os.path.join(outputPath, 'velocityField.'+step_str+'.xdmf')) as f:
+            match = re.search(r'<Time Value="([^"]+)"', f.read())
+    except OSError:
+        return np.nan
+    return float(match.group(1)) if match else np.nan
+
+
+def logged_vrms(outputPath):
+    """
+    Volume integrated Vrms per step from the Vrms.txt log of the run
+    (lines 'step time Vrms'), an empty dict if missing.
+    """
+    try:
+        log = np.loadtxt(os.path.join(outputPath, 'Vrms.txt'), ndmin=2)
+    except OSError:
+        return {}
+    return {int(step): vrms for step, time, vrms in log}
+
+
+def chunks(dset, chunk):
+    """
+    Yields consecutive hyperslabs of at most chunk rows of an h5 dataset.
+    """
+    for start in range(0, dset.shape[0], chunk):
+        yield dset[start:start+chunk]
+
+
+def element_centroids(outputPath, chunk):
+    """
+    Writes the centroid (lon km, depth km) of every element of mesh.00000.h5 to
+    a float32 .npy file next to it, read memory mapped by the workers. Elements
+    are in the same order as the dQ0 submesh fields. The vertices are copied to
+    a temporary memory mapped file rather than held in memory. The file is
+    rebuilt when it is older than the mesh or its element count differs.
+    """
+    meshFile     = os.path.join(outputPath, 'mesh.00000.h5')
+    centroidFile = os.path.join(outputPath, element_centroid_file)
+    with h5py.File(meshFile, 'r') as h5f:
+        en_map  = h5f['en_map']
+        if (os.path.exists(centroidFile) and os.path.getmtime(centroidFile) >= os.path.getmtime(meshFile)
+                and np.load(centroidFile, mmap_mode='r').shape == (en_map.shape[0], 2)):
+            return centroidFile
+        vertsFile = centroidFile+'.vertices.tmp'
+        verts     = np.lib.format.open_memmap(vertsFile, mode='w+', dtype=h5f['vertices'].dtype, shape=h5f['vertices'].shape)
+        for start in range(0, verts.shape[0], chunk):
+            verts[start:start+chunk] = h5f['vertices'][start:start+chunk]
+        centroids = np.lib.format.open_memmap(centroidFile+'.tmp', mode='w+', dtype=np.float32, shape=(en_map.shape[0], 2))
+        for start in range(0, en_map.shape[0], chunk):
+            lonlatr = sphxyz2sphlonlatr(verts[en_map[start:start+chunk]].mean(axis=1))
+            centroids[start:start+chunk, 0] = np.radians(lonlatr[:,0])*6371.
+            centroids[start:start+chunk, 1] = (1. - lonlatr[:,2])*6371.
+        centroids.flush()
+        del verts, centroids
+    os.remove(vertsFile)
+    os.replace(centroidFile+'.tmp', centroidFile)
+    return centroidFile
+
+
+def dip_fit(acc):
+    """
+    Dip (deg) of the least squares plane depth = a*x + b*y + c, x, y in km along
+    lon and lat, from accumulated sums per row of acc
+    (n, sum x, sum y, sum z, sum xx, sum xy, sum yy, sum xz, sum yz),
+    i.e. arctan(hypot(a, b)) whatever the strike; nan where undetermined.
+    """
+    dip = np.full(acc.shape[0], np.nan)
+    for i, (n, sx, sy, sz, sxx, sxy, syy, sxz, syz) in enumerate(acc):
+        normal = np.array([[sxx, sxy, sx], [sxy, syy, sy], [sx, sy, n]])
+        if n > 3 and np.linalg.cond(normal) < 1e12:
+            a, b, c = np.linalg.solve(normal, [sxz, syz, sz])
+            dip[i]  = np.degrees(np.arctan(np.hypot(a, b)))
+    return dip
+
+
+def reduce_step(task):
+    """
+    Reductions of one checkpoint, run in a worker process.
+    task = (outputPath, step_str, centroidFile, chunk)
+    """
+    outputPath, step_str, centroidFile, chunk = task
+    path        = lambda name: os.path.join(outputPath, name+'.'+step_str+'.h5')
+    result      = {'step': int(step_str), 'time': checkpoint_time(outputPath, step_str)}
+
+    # velocity: rms (unweighted) and max over nodes
+    sumSq, vmax, count = 0., 0., 0
+    with h5py.File(path('velocityField'), 'r') as h5f:
+        for v in chunks(h5f['data'], chunk):
+            vmag2  = (v**2).sum(axis=1)
+            sumSq += vmag2.sum()
+            vmax   = max(vmax, np.sqrt(vmag2.max()))
+            count += len(v)
+    result['vrms_nodal'], result['vmax'] = np.sqrt(sumSq/count), vmax
+
+    # slab: deepest subducting crust particle and dip per latitude bin, and the
+    # slab (slabIndices) and total particle count per element where the owning
+    # element of each particle was checkpointed
+    nlat        = len(LAT_BINS)-1
+    dipAcc      = np.zeros((nlat, 9))
+    tip         = np.full(3, np.nan)  # lon, lat, depth
+    centroids   = np.load(centroidFile, mmap_mode='r')
+    hasOwner    = os.path.exists(path('owningElement'))
+    if hasOwner:
+        slabCount, partCount = np.zeros(centroids.shape[0], np.int32), np.zeros(centroids.shape[0], np.int32)
+    with h5py.File(path('swarm'), 'r') as swarmH5, h5py.File(path('materialVariable'), 'r') as matH5, \
+            (h5py.File(path('owningElement'), 'r') if hasOwner else contextlib.nullcontext()) as ownerH5:
+        ownerChunks = chunks(ownerH5['data'], chunk) if hasOwner else None
+        for xyz, matVar in zip(chunks(swarmH5['data'], chunk), chunks(matH5['data'], chunk)):
+            if hasOwner:
+                # particles are saved rank by rank, so the element ids of a chunk span a narrow range
+                owner   = next(ownerChunks)[:,0]
+                lo, hi  = owner.min(), owner.max()+1
+                partCount[lo:hi] += np.bincount(owner-lo, minlength=hi-lo).astype(np.int32)
+                slabCount[lo:hi] += np.bincount(owner-lo, weights=np.isin(matVar[:,0], slabIndices), minlength=hi-lo).astype(np.int32)
+            slab    = matVar[:,0] == SubCrustIndex
+            if not slab.any():
+                continue
+            lonlatr = sphxyz2sphlonlatr(xyz[slab])
+            depth   = (1. - lonlatr[:,2])*6371.
+            deepest = depth.argmax()
+            if np.fmax(tip[2], depth[deepest]) != tip[2]:
+                tip = np.array([lonlatr[deepest,0], lonlatr[deepest,1], depth[deepest]])
+            fit     = (depth >= DIP_DEPTHS[0]) & (depth <= DIP_DEPTHS[1])
+            x       = np.radians(lonlatr[fit,0])*6371.
+            y       = np.radians(lonlatr[fit,1])*6371.
+            z       = depth[fit]
+            latBin  = np.digitize(lonlatr[fit,1], LAT_BINS) - 1
+            inside  = (latBin >= 0) & (latBin < nlat)
+            for col, values in enumerate((np.ones_like(x), x, y, z, x*x, x*y, y*y, x*z, y*z)):
+                dipAcc[:,col] += np.bincount(latBin[inside], weights=values[inside], minlength=nlat)
+    result['slab_tip_lon'], result['slab_tip_lat'], result['slab_depth_max'] = tip
+    result['slab_dip_by_lat']   = dip_fit(dipAcc)
+
+    # slab stress invariant: mean and max per depth bin over the elements holding
+    # mostly slab particles, and the mean slab centroid of each bin as the profile
+    # position (all nan without owningElement checkpoints)
+    nbins       = len(DEPTH_BINS)-1
+    sSum, sCount, sMax = np.zeros(nbins), np.zeros(nbins), np.full(nbins, np.nan)
+    lonSum, depthSum   = np.zeros(nbins), np.zeros(nbins)
+    with h5py.File(path('stressInvField_sMesh'), 'r') as h5f:
+        dset = h5f['data']
+        if dset.shape[0] != centroids.shape[0]:
+            raise ValueError("stressInvField_sMesh.{} has {} values for {} elements".format(step_str, dset.shape[0], centroids.shape[0]))
+        for start in range(0, dset.shape[0] if hasOwner else 0, chunk):
+            nPart   = partCount[start:start+chunk]
+            slab    = (nPart > 0) & (2*slabCount[start:start+chunk] >= nPart)
+            if not slab.any():
+                continue
+            stress  = dset[start:start+chunk, 0][slab]
+            lon_km, depth = np.asarray(centroids[start:start+chunk][slab], dtype=float).T
+            bins    = np.clip(np.digitize(depth, DEPTH_BINS) - 1, 0, nbins-1)
+            sSum     += np.bincount(bins, weights=stress, minlength=nbins)
+            sCount   += np.bincount(bins, minlength=nbins)
+            lonSum   += np.bincount(bins, weights=lon_km, minlength=nbins)
+            depthSum += np.bincount(bins, weights=depth, minlength=nbins)
+            for b in np.unique(bins):
+                sMax[b] = np.fmax(sMax[b], stress[bins == b].max())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['stressInv_slab_mean_by_depth'] = sSum/sCount
+        profileLon, profileDepth = lonSum/sCount, depthSum/sCount
+    result['stressInv_slab_max_by_depth'] = sMax
+    result['slab_profile_lon_km']   = profileLon
+    result['slab_profile_depth']    = profileDepth
+    # along dip distance (km): length of the centroid polyline from the shallowest slab bin
+    alongDip    = np.full(nbins, np.nan)
+    filled      = np.flatnonzero(sCount > 0)
+    if len(filled):
+        alongDip[filled] = np.concatenate(([0.], np.cumsum(np.hypot(np.diff(profileLon[filled]), np.diff(profileDepth[filled])))))
+    result['slab_profile_along_dip'] = alongDip
+
+    # trench tracers: mean position
+    for name in ('sum', 'him'):
+        trenchFile = path(name+'_trench_coords')
+        if os.path.exists(trenchFile):
+            with h5py.File(trenchFile, 'r') as h5f:
+                lonlatr = sphxyz2sphlonlatr(h5f['data'][:])
+            result[name+'_trench_lon'], result[name+'_trench_lat'] = lonlatr[:,0].mean(), lonlatr[:,1].mean()
+        else:
+            result[name+'_trench_lon'], result[name+'_trench_lat'] = np.nan, np.nan
+    return result
+
+
+def postprocess(outputPath, summaryFile=None, workers=None, chunk=1000000):
+    """
+    Reduces every checkpoint in outputPath and writes the time series to
+    summaryFile (default outputPath/summary.h5). Returns the summary file name.
+    """
+    summaryFile = summaryFile or os.path.join(outputPath, 'summary.h5')
+    steps       = checkpoint_steps(outputPath)
+    if not steps:
+        raise ValueError("No velocityField.NNNNN.h5 checkpoints in '{}'".format(outputPath))
+
+    centroidFile = element_centroids(outputPath, chunk)
+    tasks        = [(outputPath, step_str, centroidFile, chunk) for step_str in steps]
+    with multiprocessing.Pool(workers) as pool:
+        results = sorted(pool.imap_unordered(reduce_step, tasks), key=lambda r: r['step'])
+
+    series  = {key: np.array([r[key] for r in results]) for key in results[0]}
+    vrms    = logged_vrms(outputPath)
+    series['vrms'] = np.array([vrms.get(r['step'], np.nan) for r in results])
+    # trench migration rate: change of the mean trench lon (km, positive east) per model time
+    for name in ('sum', 'him'):
+        lon_km = np.radians(series[name+'_trench_lon'])*6371.
+        rate   = np.full(len(results), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate[1:] = np.diff(lon_km)/np.diff(series['time'])
+        series[name+'_trench_migration_rate'] = rate
+
+    with h5py.File(summaryFile, 'w') as h5f:
+        for key, values in series.items():
+            h5f.create_dataset(key, data=values)
+        h5f.attrs['outputPath'] = os.path.abspath(outputPath)
+        h5f.attrs['depth_bins'] = DEPTH_BINS
+        h5f.attrs['slab_indices'] = slabIndices
+        h5f.attrs['lat_bins']   = LAT_BINS
+        h5f.attrs['dip_depths'] = DIP_DEPTHS
+    return summaryFile
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m sum_sph.postprocess', description='Summary time series of a checkpoint series')
+    parser.add_argument('path', help='checkpoint directory (outputPath) or the .toml/.yaml config of the run')
+    parser.add_argument('--output', help='summary file, default <outputPath>/summary.h5')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default all cpus')
+    parser.add_argument('--chunk', type=int, default=1000000, help='rows per hyperslab read')
+    args = parser.parse_args()
+
+    outputPath = args.path if os.path.isdir(args.path) else load_config(args.path)['outputPath']
+    print (postprocess(outputPath, args.output, args.workers, args.chunk))
@@ -0,0 +1,88 @@
+# coding: utf-8
+
+import os
+
+import pytest
+
+from sum_sph.config import DEFAULTS, load_config, parse_override, validate_config, derive_paths
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_default_paths_match_baseline():
+    # strings of the original 128448608_1104_sum_sph_coh_25_DMesh.py script
+    cfg = derive_paths(validate_config({}))
+    assert cfg['res'] == '128448608_1104_DMesh'
+    assert cfg['file_str'] == '128448608_1104_DMesh_30_25'
+    assert cfg['outputPath'] == '/scratch/n69/tg7098/sum_sph_128448608_1104_DMesh_30_25_const_coh_UPDen_0.0_SPDen_1.0_LMVisc_30/'
+    assert cfg['inputPath'] == '/scratch/n69/tg7098/spherical_swarm/swarm_128448608_1104_DMesh/'
+
+
+def test_production_config_matches_defaults():
+    cfg = load_config(os.path.join(repo_dir, 'configs', '128448608_1104_sum_sph_coh_25_DMesh.toml'))
+    assert cfg == derive_paths(validate_config({}))
+
+
+def test_depth_dependent_file_str_has_mu():
+    cfg = derive_paths(validate_config({'tao_Y_OC': 'coh_mu_rho_g_z', 'deform_mesh': False}))
+    assert cfg['res'] == '128448608_1104'
+    assert cfg['file_str'] == '128448608_1104_30_25_0.01'
+
+
+def test_float_cohesion_keeps_int_paths():
+    assert derive_paths(validate_config({'sum_coh_dim': 12.5}))['file_str'] == '128448608_1104_DMesh_30_12.5'
+    assert derive_paths(validate_config({'sum_coh_dim': 25}))['file_str'] == '128448608_1104_DMesh_30_25'
+
+
+def test_yaml_numeric_strings(tmp_path):
+    pytest.importorskip('yaml')
+    path = tmp_path/'run.yaml'
+    path.write_text('inner_rtol: 1e-3\nouter_rtol: 1e-4\nLM_visc: 30\nresX: 112\n')
+    cfg = load_config(str(path))
+    assert cfg['inner_rtol'] == 1e-3 and isinstance(cfg['inner_rtol'], float)
+    assert cfg['outer_rtol'] == 1e-4
+    assert cfg['LM_visc'] == 30. and isinstance(cfg['LM_visc'], float)
+    assert cfg['resX'] == 112
+
+
+def test_overrides():
+    assert parse_override("solver='loose_inner'") == ('solver', 'loose_inner')
+    assert parse_override('solver=loose_inner') == ('solver', 'loose_inner')
+    assert parse_override('resX=112') == ('resX', 112)
+    assert parse_override('lean_diagnostics=true') == ('lean_diagnostics', True)
+    cfg = load_config(overrides=['resX=112', 'inner_rtol=default'])
+    assert cfg['resX'] == 112 and cfg['inner_rtol'] == 'default'
+    with pytest.raises(ValueError):
+        parse_override('resX')
+
+
+@pytest.mark.parametrize('settings', [
+    {'not_a_key': 1},
+    {'resX': 1.5},
+    {'resX': '112'},
+    {'deform_mesh': 1},
+    {'sum_coh_dim': True},
+    {'inner_rtol': 'loose'},
+    {'solver': 'mixed'},
+    {'tao_Y_OC': 'coh'},
+    {'bc_wanted': 'BC_OPEN'},
+    {'benchmark_scaling': 'linear'},
+    {'resZ': 0},
+    {'nonLinearMaxIterations': 0},
+    {'loose_restart': 0},
+    {'inner_rtol': float('nan')},
+    {'outer_rtol': -1e-3},
+    {'loose_inner_rtol': 1.5},
+    {'crust_depth': float('inf')},
+    {'lon_min': 130.},
+    {'benchmark': True},
+])
+def test_rejects(settings):
+    with pytest.raises(ValueError):
+        validate_config(settings)
+
+
+def test_benchmark_config_is_valid():
+    cfg = load_config(os.path.join(repo_dir, 'configs', 'benchmark.toml'))
+    assert cfg['benchmark'] and not cfg['deform_mesh']
+    assert set(cfg) == set(DEFAULTS) | {'res', 'file_str', 'outputPath', 'inputPath'}
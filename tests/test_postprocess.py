@@ -0,0 +1,126 @@
+# coding: utf-8
+
+import os
+
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip('h5py')
+
+from sum_sph.geometry import sphlonlatr2sphxyz
+from sum_sph.materials import SubCrustIndex, SubMantleIndex, HIMCrustIndex, UMantleIndex, LMantleIndex
+from sum_sph.postprocess import element_centroids, element_centroid_file, reduce_step, postprocess
+
+
+def write_h5(path, data):
+    with h5py.File(str(path), 'w') as h5f:
+        h5f.create_dataset('data', data=data)
+
+
+def lonlatdepth2xyz(lon, lat, depth):
+    return sphlonlatr2sphxyz(np.column_stack((lon, lat, 1. - np.asarray(depth)/6371.)))
+
+
+def plane_particles(lon, lat, depth_fn):
+    lon, lat = [a.ravel() for a in np.meshgrid(lon, lat)]
+    depth    = depth_fn(np.radians(lon)*6371., np.radians(lat)*6371.)
+    keep     = (depth >= 0.) & (depth <= 300.)
+    return lonlatdepth2xyz(lon[keep], lat[keep], depth[keep])
+
+
+@pytest.fixture
+def series(tmp_path):
+    """
+    Checkpoints 00000 and 00001 of a 2 (lon) x 1 (lat) x 2 (depth) element mesh,
+    depth layers 0-80 and 80-160 km, element e = 2*lon index + depth index.
+    """
+    lon, lat, depth = np.array([-1., 0., 1.]), np.array([-1., 1.]), np.array([0., 80., 160.])
+    L, T, D  = np.meshgrid(lon, lat, depth, indexing='ij')
+    vertices = lonlatdepth2xyz(L.ravel(), T.ravel(), D.ravel())
+    node     = np.arange(vertices.shape[0]).reshape(L.shape)
+    en_map   = np.array([[node[i+a, b, k+c] for c in (0, 1) for b in (0, 1) for a in (0, 1)]
+                         for i in range(2) for k in range(2)])
+    with h5py.File(str(tmp_path/'mesh.00000.h5'), 'w') as h5f:
+        h5f.create_dataset('vertices', data=vertices)
+        h5f.create_dataset('en_map', data=en_map)
+
+    # element 0: 3 of 4 slab, element 1: 1 of 4 slab (HIM crust over lower mantle),
+    # element 2: all slab, element 3: the SubCrust particles of the dip planes and tip
+    material = [SubMantleIndex]*3 + [UMantleIndex] + [HIMCrustIndex] + [LMantleIndex]*3 + [SubMantleIndex]*4
+    owner    = [0]*4 + [1]*4 + [2]*4
+    xyz      = [lonlatdepth2xyz(np.zeros(12), np.zeros(12), np.full(12, 40.))]
+    # north dipping (30 deg) plane at lat 0.5..5, east dipping (45 deg) plane at lat -5..-0.5
+    y0, x0   = np.radians(0.5)*6371., np.radians(-2.)*6371.
+    xyz     += [plane_particles(np.linspace(-2., 2., 9), np.linspace(0.5, 5., 10), lambda x, y: np.tan(np.radians(30.))*(y - y0)),
+                plane_particles(np.linspace(-2., 2., 9), np.linspace(-5., -0.5, 10), lambda x, y: (x - x0))]
+    # deepest subducting crust particle
+    xyz     += [lonlatdepth2xyz([0.2], [0.3], [400.])]
+    nCrust   = sum(len(p) for p in xyz[1:])
+    xyz      = np.concatenate(xyz)
+    material = np.array(material + [SubCrustIndex]*nCrust, dtype=np.int32)[:,None]
+    owner    = np.array(owner + [3]*nCrust, dtype=np.int32)[:,None]
+
+    # half the nodes at |v| = 5, half at rest
+    velocity = np.zeros((vertices.shape[0], 3))
+    velocity[::2] = (3., 4., 0.)
+    for step, time in ((0, 0.), (1, 2.)):
+        step_str = str(step).zfill(5)
+        write_h5(tmp_path/('velocityField.'+step_str+'.h5'), velocity)
+        (tmp_path/('velocityField.'+step_str+'.xdmf')).write_text('<Time Value="{}" />'.format(time))
+        write_h5(tmp_path/('swarm.'+step_str+'.h5'), xyz)
+        write_h5(tmp_path/('materialVariable.'+step_str+'.h5'), material)
+        write_h5(tmp_path/('owningElement.'+step_str+'.h5'), owner)
+        write_h5(tmp_path/('stressInvField_sMesh.'+step_str+'.h5'), np.array([[1.], [2.], [3.], [4.]]))
+        write_h5(tmp_path/('sum_trench_coords.'+step_str+'.h5'), lonlatdepth2xyz([float(step)]*2, [-1., 1.], [15.]*2))
+    (tmp_path/'Vrms.txt').write_text('0 0.0 1.5\n1 2.0 1.25\n')
+    return str(tmp_path)
+
+
+def test_reduce_step(series):
+    centroidFile = element_centroids(series, chunk=3)
+    assert os.path.dirname(centroidFile) == series and os.path.basename(centroidFile) == element_centroid_file
+    result = reduce_step((series, '00001', centroidFile, 5))
+
+    assert result['step'] == 1 and result['time'] == 2.
+    assert result['vrms_nodal'] == pytest.approx(np.sqrt(12.5))
+    assert result['vmax'] == pytest.approx(5.)
+
+    assert result['slab_depth_max'] == pytest.approx(400.)
+    assert result['slab_tip_lon'] == pytest.approx(0.2) and result['slab_tip_lat'] == pytest.approx(0.3)
+    dip = result['slab_dip_by_lat']
+    assert dip[3] == pytest.approx(45.) and dip[4] == pytest.approx(30.)
+    assert np.isnan(np.delete(dip, [3, 4])).all()
+
+    # slab elements 0, 2 (0-50 km bin) and 3 (100-150 km bin), not element 1
+    mean, smax = result['stressInv_slab_mean_by_depth'], result['stressInv_slab_max_by_depth']
+    assert mean[0] == pytest.approx(2.) and smax[0] == 3.
+    assert mean[2] == pytest.approx(4.) and smax[2] == 4.
+    assert np.isnan(np.delete(mean, [0, 2])).all() and np.isnan(np.delete(smax, [0, 2])).all()
+    depth, lon_km, along = result['slab_profile_depth'], result['slab_profile_lon_km'], result['slab_profile_along_dip']
+    assert depth[0] == pytest.approx(40., abs=2.) and depth[2] == pytest.approx(120., abs=2.)
+    assert lon_km[0] == pytest.approx(0., abs=1e-6) and lon_km[2] == pytest.approx(np.radians(0.5)*6371., rel=1e-2)
+    assert along[0] == 0. and along[2] == pytest.approx(np.hypot(lon_km[2] - lon_km[0], depth[2] - depth[0]))
+    assert np.isnan(np.delete(along, [0, 2])).all()
+
+
+def test_reduce_step_without_slab(series):
+    # mantle only, checkpoint written before owningElement was saved
+    write_h5(os.path.join(series, 'materialVariable.00000.h5'), np.zeros((13, 1), dtype=np.int32))
+    write_h5(os.path.join(series, 'swarm.00000.h5'), lonlatdepth2xyz(np.zeros(13), np.zeros(13), np.full(13, 40.)))
+    os.remove(os.path.join(series, 'owningElement.00000.h5'))
+    result = reduce_step((series, '00000', element_centroids(series, chunk=3), 5))
+    assert np.isnan([result['slab_depth_max'], result['slab_tip_lon'], result['slab_tip_lat']]).all()
+    assert np.isnan(result['slab_dip_by_lat']).all()
+    assert np.isnan(result['stressInv_slab_mean_by_depth']).all()
+
+
+def test_postprocess_summary(series):
+    summaryFile = postprocess(series, workers=1, chunk=4)
+    with h5py.File(summaryFile, 'r') as h5f:
+        assert list(h5f['step'][:]) == [0, 1]
+        assert list(h5f['time'][:]) == [0., 2.]
+        assert list(h5f['vrms'][:]) == [1.5, 1.25]
+        rate = h5f['sum_trench_migration_rate'][:]
+        assert np.isnan(rate[0]) and rate[1] == pytest.approx(np.radians(1.)*6371./2.)
+        assert np.isnan(h5f['him_trench_lon'][:]).all()
+        assert h5f['stressInv_slab_mean_by_depth'].shape == (2, 10)